@@ -1,18 +1,31 @@
 # This file is part of TallyBot (https://github.com/sagrawalx/tallybot)
 
+import re
 import string
-from re import search
 from datetime import datetime, timedelta
 
+# Google's RE2 engine (pip install google-re2) matches in a single linear
+# scan, which helps when backfilling thousands of messages. It's optional:
+# everything falls back to the standard library if it isn't installed.
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Offset of each weekday from Monday; built once since it never changes
+_DOW = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
 class Label:
     """
     An abstract class to represent a label. 
     
     Any subclass should implement two methods: 
     
-    * label(), which returns the label as a string.  
-    * get_deadline(), which returns the deadline as a datetime object. 
+    * label(), which returns the label as a string.
+    * get_deadline(), which returns the deadline as a datetime object.
     """
+    __slots__ = ()
+
     def label(self) -> str:
         pass
     
@@ -28,32 +41,47 @@ class LabelingScheme:
     * topic_match(), which takes as input a topic string and returns a matching
       label as a Label object, if a match exists (else None). 
     * message_match(), which takes as input a message string and returns a
-      matching label as a Label object, if a match exists (else None). 
+      matching label as a Label object, if a match exists (else None).
     """
-    def topic_match(self, topic: str) -> Label: 
+    def topic_match(self, topic: str) -> Label:
         pass
-    
+
     def message_match(self, message: str) -> Label:
         pass
 
+    def topic_match_batch(self, topics: list) -> list:
+        """
+        Apply topic_match() to a list of topic strings and return the list of
+        results. Subclasses may override this with something faster than the
+        obvious loop.
+        """
+        return [self.topic_match(t) for t in topics]
+
 class StandardLabel(Label):
     """
     A standard label. See the documentation for StandardLabelingScheme below 
     for further information about what this means. The __init__ method is
     for internal use only. Instances of this class should be created only using
-    the topic_match() and message_match() methods of StandardLabelingScheme. 
+    the topic_match() and message_match() methods of StandardLabelingScheme.
     """
+    __slots__ = ("_label", "_week", "_day", "_labeling", "_deadline_value")
+
     def __init__(self, labeling: LabelingScheme, label: str, week: int, day: int):
         self._label = label
         self._week = week
         self._day = day
         self._labeling = labeling
-    
+        self._deadline_value = None
+
     def label(self) -> str:
         return self._label
-    
+
     def deadline(self) -> datetime:
-        return self._labeling._deadline(self)
+        # Computed lazily and remembered, since the same label is asked for
+        # its deadline once per message that carries it
+        if self._deadline_value is None:
+            self._deadline_value = self._labeling._deadline(self)
+        return self._deadline_value
 
 class StandardLabelingScheme(LabelingScheme):
     """
@@ -93,9 +121,14 @@ class StandardLabelingScheme(LabelingScheme):
     the method message_match). For topics (ie, for the method topic_match()), 
     the same pattern must be contained inside square brackets. 
     
-    This class contains the regex given above as a class variable called regex. 
+    This class contains the regex given above as a class variable called regex.
+    The bare and bracketed forms are compiled once, at class creation time, so
+    that the matching methods don't re-concatenate and re-compile pattern
+    strings on every call.
     """
     regex = r"w(\d+)(mon|tue|wed|thu|fri|sat|sun)"
+    _message_pattern = re.compile(regex)
+    _topic_pattern = re.compile(r"\[(" + regex + r")\]")
 
     def __init__(self, config: dict):
         """
@@ -112,13 +145,35 @@ class StandardLabelingScheme(LabelingScheme):
             if "exceptions" in config.keys() else []
         self._gaps = config["gaps"] \
             if "gaps" in config.keys() else []
-        
+
+        self._topic_re2 = re2.compile(r"\[(" + StandardLabelingScheme.regex + r")\]") \
+            if re2 is not None else None
+
+        # The set of well-formed labels is small and fully enumerable, so
+        # enumerate it once here. Validating a candidate label then becomes a
+        # single set lookup instead of the max_week/due_days/exceptions checks.
+        self._valid_labels = {
+            f"w{w}{d}"
+            for w in range(1, self._max_week + 1)
+            for d in self._due_days
+        } - set(self._exceptions)
+
+        # Precompute the day offset of each week's Monday from start_date,
+        # accounting for gaps, so that _deadline() is pure arithmetic
+        self._week_offset = [0] * (self._max_week + 1)
+        for w in range(1, self._max_week + 1):
+            week = w
+            for g in self._gaps:
+                if week >= g:
+                    week += 1
+            self._week_offset[w] = 7 * (week - 1)
+
     def topic_match(self, topic: str) -> StandardLabel: 
         """
         Find a standard label inside a topic and return the label if there
         is a match, else return None. See class documentation for details. 
         """
-        match = search(r"\[(" + StandardLabelingScheme.regex + r")\]", topic)
+        match = StandardLabelingScheme._topic_pattern.search(topic)
         if match is None:
             return None
         a, b, c = match.group(1), match.group(2), match.group(3)
@@ -129,12 +184,31 @@ class StandardLabelingScheme(LabelingScheme):
         Find a standard label inside a topic and return the label if there
         is a match, else return None. See class documentation for details. 
         """
-        match = search(StandardLabelingScheme.regex, message)
+        match = StandardLabelingScheme._message_pattern.search(message)
         if match is None:
             return None
         a, b, c = match.group(0), match.group(1), match.group(2)
         return self._create_label(a, b, c)
-                
+
+    def topic_match_batch(self, topics: list) -> list:
+        """
+        Apply topic_match() to a list of topic strings and return the list of
+        results. When the optional re2 module is installed, this uses RE2's
+        linear-time engine, which scans large batches of topics faster than
+        the standard library's backtracking engine.
+        """
+        search = self._topic_re2.search if self._topic_re2 is not None \
+            else StandardLabelingScheme._topic_pattern.search
+        labels = []
+        for t in topics:
+            match = search(t)
+            if match is None:
+                labels.append(None)
+            else:
+                a, b, c = match.group(1), match.group(2), match.group(3)
+                labels.append(self._create_label(a, b, c))
+        return labels
+
     def _create_label(self, a: str, b: str, c: str) -> StandardLabel:
         """
         For internal use only. Creates a StandardLabel object from:
@@ -144,30 +218,24 @@ class StandardLabelingScheme(LabelingScheme):
         * c -- the substring representing the day of week.
         
         Returns None if the label would be excluded by the max_week, due_days,
-        or exceptions parameters, as specified in the class documentation. 
+        or exceptions parameters, as specified in the class documentation.
         """
-        if a in self._exceptions:
+        if a not in self._valid_labels:
             return None
         b = int(b)
-        if b > self._max_week:
-            return None
-        if c not in self._due_days:
-            return None
-        
-        days_of_week = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
-        c = days_of_week[c]
-        return StandardLabel(self, a, b, c)
+
+        return StandardLabel(self, a, b, _DOW[c])
             
     def _deadline(self, label: StandardLabel) -> datetime:
         """
-        For internal use only. Returns the deadline of the given standard 
+        For internal use only. Returns the deadline of the given standard
         label, using the week number, day, and gaps, as specified in the class
-        documentaiton. 
+        documentaiton.
         """
-        week = label._week
-        day = label._day
-        for g in self._gaps:
-            if week >= g:
-                week += 1
-        return self._start + timedelta(days = 7*(week-1) + day)
-        
+        return self._start + timedelta(days = self._week_offset[label._week] + label._day)
+
+# Registry of labeling schemes that can be named by the labeling_scheme key
+# in config.yml. Alternative LabelingScheme subclasses should be added here.
+SCHEMES = {
+    "StandardLabelingScheme": StandardLabelingScheme,
+}
@@ -1,13 +1,24 @@
 # This file is part of TallyBot (https://github.com/sagrawalx/tallybot)
 
+import csv
+import io
+import queue
+import re
 import string
+import threading
 import yaml
+import zulip
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from zulip_bots.lib import BotHandler
 from labelingscheme import *
 from userlist import *
 
+# Translation table for minimize() below; built once since it never changes
+_PUNC_REMOVER = str.maketrans("", "", string.punctuation)
+
 class TallyBotHandler:
     def usage(self) -> str:
         return """
@@ -33,12 +44,19 @@ class TallyBotHandler:
         """
     
     def handle_message(self, message: dict, bot_handler: BotHandler) -> None:
-        try: 
+        users = None
+        try:
             # Extract client
             client = bot_handler._client
             
-            # Delete all stream messages mentioning this bot
-            clear_stream_mentions(client)
+            # Delete the stream message that tagged this bot right away, so a
+            # message fetch below can't cache it before it disappears. The
+            # rest of the mention cleanup (eg, messages that tagged the bot
+            # while it was offline) happens on a background thread so the
+            # response isn't held up by it.
+            if message["type"] == "stream":
+                client.delete_message(message["id"])
+            schedule_clear_stream_mentions(client)
             
             # Minimize message content
             message["content"] = minimize(message["content"])
@@ -56,12 +74,17 @@ class TallyBotHandler:
             if "clear" in message["content"]:
                 clear_pm_history(client, interloc)
                 return None
-            
+
+            # Re-fetch the full stream history below, if requested; this is
+            # how reaction and topic changes to old messages get picked up
+            rebuild = "rebuild" in message["content"]
+            if rebuild:
+                message["content"] = message["content"].replace("rebuild", "").strip()
+
             # Collect configuration data
-            config_file = bot_handler.open("config.yml")
-            config = get_config(config_file, message)
-            config_file.close()
-            
+            config_path = os.path.join(bot_handler._root_dir, "config.yml")
+            config = get_config(config_path, message)
+
             if config is None: 
                 response = "No configuration data was matched. You must either "\
                 "(a) tag me in a stream message in the class stream that you're "\
@@ -76,13 +99,16 @@ class TallyBotHandler:
             # Initialize user database
             users = UserList(bot_handler, config["stream_specifier"])
             
-            # Use configuration data to instantiate the labeling scheme
-            scheme = eval(config.pop("labeling_scheme", "StandardLabelingScheme"))
-            assert issubclass(scheme, LabelingScheme)
-            labeling = scheme(config.pop("labeler_config"))
+            # Use configuration data to instantiate the labeling scheme,
+            # reusing the cached instance when the config hasn't changed
+            labeling = _LABELING_CACHE.get(config["stream_specifier"])
+            if labeling is None:
+                scheme = SCHEMES[config.pop("labeling_scheme", "StandardLabelingScheme")]
+                labeling = scheme(config.pop("labeler_config"))
+                _LABELING_CACHE[config["stream_specifier"]] = labeling
             
             # Get messages
-            messages = get_messages(bot_handler, users, config, labeling)
+            messages = get_messages(bot_handler, users, config, labeling, rebuild)
             
             if messages is None:
                 response = "There was an unexpected problem. Please try again, "\
@@ -105,22 +131,26 @@ class TallyBotHandler:
                     response = all_counts(tally, users)
                 # Else return all matching counts in verbose format
                 else:
-                    response = ""
+                    parts = []
                     for m in matches:
-                        response += m["full_name"] + "\n"
-                        response += individual_count(tally, m["user_id"])
-                        response += "\n\n"
+                        parts.append(m["full_name"] + "\n"
+                            + individual_count(tally, m["user_id"]))
+                    response = "\n\n".join(parts)
             
             # Issue response
-            respond(client, interloc, response) 
-        
-        # KeyError only if Zulip API returns something unexpected 
-        except KeyError as k:
-            print(f"The key {k} raised a KeyError. This shouldn't happen..." )
-        
-        # Return
+            respond(client, interloc, response)
+
+        # Don't crash the bot on a failed or rate-limited request; the user
+        # can simply retry. Anything else (eg, a KeyError from an unexpected
+        # API response) propagates so that regressions are visible in the
+        # bot's log instead of being silently swallowed.
+        except (zulip.ZulipError, OSError) as e:
+            print(f"Zulip request failed: {e}")
+
+        # Flush any user rows buffered while handling this message
         finally:
-           return None
+            if users is not None:
+                users.flush()
 
 handler_class = TallyBotHandler
 
@@ -135,7 +165,8 @@ def clear_pm_history(client, interloc: dict) -> None:
         anchor = "newest" if len(batch) == 0 else batch[-1]["id"]
         request = {
             "anchor": anchor,
-            "num_before": 5000,
+            "client_gravatar": "true",
+            "num_before": 1000,
             "num_after": 0,
             "narrow": [
                 {"operator": "pm-with", "operand": interloc["email"]}
@@ -144,10 +175,11 @@ def clear_pm_history(client, interloc: dict) -> None:
         result = client.get_messages(request)
         found_oldest = result["found_oldest"]
         batch = result["messages"]
-        
-        # Delete messages
-        for m in batch:
-            client.delete_message(m["id"])
+
+        # Delete messages; each deletion is its own round trip to the
+        # server, so overlap them across a pool of threads
+        with ThreadPoolExecutor(max_workers = 16) as executor:
+            list(executor.map(client.delete_message, [m["id"] for m in batch]))
             
 def clear_stream_mentions(client) -> None:
     """
@@ -157,112 +189,179 @@ def clear_stream_mentions(client) -> None:
     found_oldest = False
     while not found_oldest: 
         # Run request
-        anchor = "newest" if len(batch) == 0 else batch[-1]["id"]
+        anchor = "newest" if len(batch) == 0 else batch[0]["id"]
         request = {
-            "anchor": "newest",
-            "num_before": 5000,
+            "anchor": anchor,
+            "client_gravatar": "true",
+            "num_before": 1000,
             "num_after": 0,
             "narrow": [{"operator": "is", "operand": "mentioned"}]
         }
         result = client.get_messages(request)
         batch = result["messages"]
         found_oldest = result["found_oldest"]
-        
-        # Delete messages
-        for m in batch:
-            if m["type"] == "stream":
-                client.delete_message(m["id"])
+
+        # Delete stream messages; each deletion is its own round trip to the
+        # server, so overlap them across a pool of threads
+        ids = [m["id"] for m in batch if m["type"] == "stream"]
+        with ThreadPoolExecutor(max_workers = 16) as executor:
+            list(executor.map(client.delete_message, ids))
+
+# Jobs for the background cleanup worker; each job is a client whose stream
+# mentions should be cleared. The worker thread is started on first use.
+_CLEANUP_QUEUE = queue.Queue()
+_CLEANUP_THREAD = None
+
+def _cleanup_worker() -> None:
+    """
+    Background worker that runs clear_stream_mentions jobs one at a time, so
+    that deletion sweeps never overlap each other.
+    """
+    while True:
+        client = _CLEANUP_QUEUE.get()
+        # A failed sweep (network blip, rate-limited response) shouldn't
+        # kill the worker; log it and move on to the next job
+        try:
+            clear_stream_mentions(client)
+        except Exception as e:
+            print(f"Mention sweep failed: {e}")
+        finally:
+            _CLEANUP_QUEUE.task_done()
+
+def schedule_clear_stream_mentions(client) -> None:
+    """
+    Enqueue a clear_stream_mentions sweep on the background cleanup thread,
+    so that handle_message can respond without waiting on deletions.
+    """
+    global _CLEANUP_THREAD
+    if _CLEANUP_THREAD is None or not _CLEANUP_THREAD.is_alive():
+        _CLEANUP_THREAD = threading.Thread(target = _cleanup_worker, daemon = True)
+        _CLEANUP_THREAD.start()
+    _CLEANUP_QUEUE.put(client)
 
 def respond(client, interloc: dict, response: str, num_lines: int = 150) -> None:
     """
-    Uses the given client to send the interlocutor a private message containing 
-    the given response. 
+    Uses the given client to send the interlocutor a private message containing
+    the given response, split into chunks of at most num_lines lines.
     """
-    i = 0
-    lines = 0
-    msg = ""
-    while i < len(response):
-        if lines < num_lines:
-            msg += response[i]
-            if response[i] == "\n":
-                lines += 1
-        if lines == num_lines or i+1 == len(response):
-            request = {
-                "type": "private",
-                "to": [interloc["user_id"]],
-                "content": msg,
-            }
-            client.send_message(request)
-            lines = 0
-            msg = ""
-        i += 1
+    lines = response.splitlines(keepends = True)
+    for i in range(0, len(lines), num_lines):
+        request = {
+            "type": "private",
+            "to": [interloc["user_id"]],
+            "content": "".join(lines[i:i+num_lines]),
+        }
+        client.send_message(request)
 
 def minimize(x: str) -> str:
     """
     Converts a string to lower case, removes all punctuation, and strips any
     trailing whitespace. 
     """
-    punc_remover = str.maketrans("", "", string.punctuation)
-    return x.lower().translate(punc_remover).strip()
+    return x.lower().translate(_PUNC_REMOVER).strip()
     
-def get_config(config_file, message: dict) -> dict:
+# Parsed contents of config.yml, cached by modification time so that the
+# YAML parser runs only when the file actually changes
+_CONFIG_CACHE = {"mtime": None, "data": None, "specifiers": None, "pattern": None}
+
+# Parse with the libyaml C backend when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Labeling scheme instances keyed by stream specifier, so schemes (and any
+# patterns or tables they precompute) are built once per config load rather
+# than once per message; cleared whenever config.yml is reloaded
+_LABELING_CACHE = {}
+
+def get_config(config_path: str, message: dict) -> dict:
     """
     Extract configuration data from the message. If the message was a stream
     message, configuration data is extracting using the name of the stream. If
     message was a private message, the content of the message must contain a
     specifying information (short specifier or full stream name). If nothing
-    matches, returns None. 
-    
+    matches, returns None.
+
     If the message is a private message and contains a valid stream specifier,
-    this method will modify message["content"] by removing that stream 
-    specifier from the string and then stripping any trailing whitespace. 
+    this method will modify message["content"] by removing that stream
+    specifier from the string and then stripping any trailing whitespace.
     """
-    configs = yaml.safe_load(config_file)
-    
+    # Reparse the config file only if it has changed since the last message
+    mtime = os.stat(config_path).st_mtime_ns
+    if mtime != _CONFIG_CACHE["mtime"]:
+        with open(config_path) as config_file:
+            configs = yaml.load(config_file, Loader = _YAML_LOADER)
+
+        # Precompute each entry's minimized stream name once per reload
+        for c in configs:
+            c["_min_name"] = minimize(c["stream_name"])
+
+        # Build one alternation regex over all specifying strings (short
+        # specifiers and minimized stream names), mapping each back to its
+        # config entry, so private messages are matched in a single search
+        specifiers = {}
+        for c in configs:
+            specifiers[c["stream_specifier"]] = c
+            specifiers[c["_min_name"]] = c
+        pattern = re.compile("|".join(re.escape(s) for s in specifiers))
+
+        _CONFIG_CACHE["data"] = configs
+        _CONFIG_CACHE["specifiers"] = specifiers
+        _CONFIG_CACHE["pattern"] = pattern
+        _CONFIG_CACHE["mtime"] = mtime
+
+        # Labeling schemes were built from the old config; rebuild on demand
+        _LABELING_CACHE.clear()
+    configs = _CONFIG_CACHE["data"]
+
+    # Matches are returned as shallow copies, since handle_message pops keys
+    # off the config it receives and the cached entries must stay intact
+
     # If stream message:
     if message["type"] == "stream":
         stream_name = message["display_recipient"]
         for c in configs:
             if c["stream_name"] == stream_name:
-                return c
-            
+                return dict(c)
+
     # Else should be a private message:
     elif message["type"] == "private":
-        for c in configs:
-            # List of possible specifying strings to look for in the message
-            names = [c["stream_specifier"], minimize(c["stream_name"])]
-            
-            # For each possible specifying string...
-            for x in names:
-                # Try removing that specifying string
-                m = message["content"].replace(x, "").strip()
-                
-                # If something was actually removed, a match was found!
-                if len(m) < len(message["content"]):
-                    # Truncate the message content by removing the match
-                    message["content"] = m
-                    
-                    # Return the configuration data
-                    return c
-    
-    # If no configuration data was matched ...         
+        content = message["content"]
+        m = _CONFIG_CACHE["pattern"].search(content)
+        if m is not None:
+            # Truncate the message content by removing the match
+            message["content"] = (content[:m.start()] + content[m.end():]).strip()
+
+            # Return the configuration data
+            return dict(_CONFIG_CACHE["specifiers"][m.group(0)])
+
+    # If no configuration data was matched ...
     return None
     
-def get_messages(bot_handler, users: UserList, config: dict, labeling: LabelingScheme) -> list:
+def get_messages(bot_handler, users: UserList, config: dict, labeling: LabelingScheme, rebuild: bool = False) -> list:
     """
     Returns a list of all messages by members whose topic has a match for the
     labeling scheme, ie, for which the topic_match() method of the given
-    labeling scheme returns something other than None. 
+    labeling scheme returns something other than None.
+
+    Messages are always paged forward: from the oldest stream message on the
+    first run, and from the highest id in the backup file afterwards, so a
+    steady-state invocation fetches only the delta since the last run.
+    Paging forward also means an interrupted backfill leaves the backup file
+    holding a prefix of the history, which the next invocation simply
+    resumes from. Pass rebuild=True to ignore the backup file's high-water
+    mark and re-fetch the full stream history (eg, if reactions or topics
+    of old messages are known to have changed).
     """
     # Initialize backup file
     name = f"data_msgs_{config['stream_specifier']}.csv"
     filepath = os.path.join(bot_handler._root_dir, name)
     client = bot_handler._client
       
-    # Create backup file if needed
-    csvfile = open(filepath, "a", newline="")
-    csvfile.close()
-    
+    # Create backup file if needed, writing the header line if the file is new
+    field_names = ["id", "sender_id", "sender_name", "sender_email", "label", "content", "timestamp", "on_time", "valid"]
+    with open(filepath, "a", newline="") as csvfile:
+        if csvfile.tell() == 0:
+            DictWriter(csvfile, field_names).writeheader()
+
     # Load messages from backup file
     messages = {}
     with open(filepath, newline="") as csvfile:
@@ -275,91 +374,190 @@ def get_messages(bot_handler, users: UserList, config: dict, labeling: LabelingS
             msg["valid"] = msg["valid"] == "True"
             messages[msg["id"]] = msg
     
-    # Get messages from client  
-    batch = []
-    found_oldest = False
-    while not found_oldest: 
-        # Run request for batch of messages
-        anchor = "newest" if len(batch) == 0 else batch[0]["id"]
-        request = {
+    # Highest message id already in the backup file, if any. With no cached
+    # messages (or on a rebuild) we start over from the oldest stream
+    # message; otherwise we sync forward from this cursor.
+    last_seen = None if rebuild else max(messages, default=None)
+    backfill = last_seen is None
+
+    # New messages are appended to the backup file as they arrive; a full
+    # rewrite is needed only if already-cached rows changed or were dropped
+    existing_ids = set(messages)
+    rewrite = False
+    csvfile = open(filepath, "a", newline="")
+    writer = DictWriter(csvfile, field_names)
+
+    # Request for one page of messages, anchored at the given message id
+    def page_request(anchor):
+        return {
             "anchor": anchor,
             "apply_markdown": "false",
-            "num_before": 5000,
-            "num_after": 0,
+            "client_gravatar": "true",
+            "num_before": 0,
+            "num_after": 1000,
             "narrow": [
-                {"operator": "stream", 
+                {"operator": "stream",
                 "operand": config["stream_name"]}
             ]
         }
-        result = client.get_messages(request)
-        batch = result["messages"]
-        found_oldest = result["found_oldest"]
-        
-        # Go through result messages to extract relevant information
-        for m in batch:
-            keep = True
-            
-            # Drop bot messages
-            if m["sender_full_name"] == "Notification Bot":
-                keep = False
-            elif m["sender_full_name"] == "Welcome Bot":
-                keep = False
-            else:
-                # Drop moderator messages
-                sender = users.get(m["sender_id"])
-                if sender["role"] <= 300:
+
+    # Many messages share one topic (one per assignment), so remember the
+    # label each subject maps to and match every distinct subject only once
+    topic_cache = {}
+
+    # On a rebuild, the ids the full re-fetch returns; cached messages the
+    # server no longer has (ie, deleted ones) are evicted afterwards
+    fetched_ids = set()
+
+    # Each label's deadline as raw epoch seconds, so that the per-message
+    # on-time check is a plain number comparison with no datetime objects
+    deadline_ts = {}
+
+    # Hoisted out of the message loop; the bound methods are bound once here
+    # rather than looked up per message
+    mod_ids = users.moderator_ids()
+    invalid_emoji = config["invalid_emoji"]
+    users_get = users.get
+    fromtimestamp = datetime.fromtimestamp
+
+    # Get messages from client. A single-worker pool prefetches the next
+    # page while the current page is being classified, hiding the per-page
+    # request latency behind the processing work.
+    done = False
+    executor = ThreadPoolExecutor(max_workers = 1)
+    # The finally below makes sure a failed page request still flushes the
+    # rows appended so far and doesn't leak the prefetch thread
+    try:
+        future = executor.submit(client.get_messages,
+            page_request("oldest" if backfill else last_seen))
+        while not done:
+            result = future.result()
+            batch = result["messages"]
+            done = result["found_newest"]
+
+            # Drop the anchor message itself (the server includes it) and
+            # anything else at or below the cursor, then advance the cursor
+            if last_seen is not None:
+                batch = [m for m in batch if m["id"] > last_seen]
+            if len(batch) > 0:
+                last_seen = batch[-1]["id"]
+
+            # Kick off the next page's request before classifying this page
+            if not done:
+                if len(batch) == 0:
+                    done = True
+                else:
+                    future = executor.submit(client.get_messages,
+                        page_request(last_seen))
+
+            if rebuild:
+                fetched_ids.update(m["id"] for m in batch)
+
+            # Match any topics in this batch not already seen, all at once
+            subjects = [m["subject"] for m in batch]
+            new_subjects = [s for s in set(subjects) if s not in topic_cache]
+            topic_cache.update(zip(new_subjects, labeling.topic_match_batch(new_subjects)))
+            labels = [topic_cache[s] for s in subjects]
+
+            # Go through result messages to extract relevant information
+            for m, label in zip(batch, labels):
+                keep = True
+
+                # Drop bot messages
+                if m["sender_full_name"] == "Notification Bot":
+                    keep = False
+                elif m["sender_full_name"] == "Welcome Bot":
                     keep = False
-                else: 
-                    # Drop messages whose topics don't match labeling scheme 
-                    label = labeling.topic_match(m["subject"])
-                    if label is None:
+                # Drop messages from known moderators: a set lookup, before any
+                # further work on the message
+                elif m["sender_id"] in mod_ids:
+                    keep = False
+                # Drop messages whose topics don't match labeling scheme
+                elif label is None:
+                    keep = False
+                else:
+                    # Look up the sender, dropping moderators that were not yet
+                    # in the user list
+                    sender = users_get(m["sender_id"])
+                    if sender["role"] <= 300:
                         keep = False
             
-            # Collect data from kept messages
-            if keep:
-                # Determine if message was on time
-                timestamp = datetime.fromtimestamp(m["timestamp"])
-                
-                # Check to see if there's in invalid_emoji reaction
-                valid = True
-                for r in m["reactions"]:
-                    if r["emoji_name"] == config["invalid_emoji"]:
-                        # Check to see if the reactor was a moderator
-                        reactor = users.get(r["user"]["id"])
-                        if reactor["role"] <= 300:
-                            valid = False
-                            break
-                
-                # Consolidate relevant information
-                msg = {
-                    "id" : m["id"], 
-                    "sender_id" : sender["user_id"], 
-                    "sender_name" : sender["full_name"],
-                    "sender_email" : sender["delivery_email"],
-                    "label" : label.label(),
-                    "content" : m["content"],
-                    "timestamp" : timestamp,
-                    "on_time" : (timestamp <= label.deadline()),
-                    "valid" : valid
-                }
+                # Collect data from kept messages
+                if keep:
+                    # Determine if message was on time
+                    due = deadline_ts.get(label)
+                    if due is None:
+                        due = label.deadline().timestamp()
+                        deadline_ts[label] = due
+                    on_time = m["timestamp"] <= due
+
+                    # Keep a datetime version of the timestamp for the record
+                    timestamp = fromtimestamp(m["timestamp"])
+
+                    # Check to see if a moderator reacted with the invalid
+                    # emoji; any() stops at the first such reaction, and the
+                    # reactor lookups are served from the user list's cache
+                    valid = not any(
+                        r["emoji_name"] == invalid_emoji
+                        and users_get(r["user"]["id"])["role"] <= 300
+                        for r in m["reactions"]
+                    )
+
+                    # Consolidate relevant information
+                    msg = {
+                        "id" : m["id"], 
+                        "sender_id" : sender["user_id"], 
+                        "sender_name" : sender["full_name"],
+                        "sender_email" : sender["delivery_email"],
+                        "label" : label.label(),
+                        "content" : m["content"],
+                        "timestamp" : timestamp,
+                        "on_time" : on_time,
+                        "valid" : valid
+                    }
                 
-                # Add message to message list
-                messages[m["id"]] = msg
-            
-            # If message is now not-to-be-kept but was in the backup file, it 
-            # should be deleted. Since message sender cannot change, this can 
-            # only happen if and only if a message is moved from a RQ topic to 
-            # a non-RQ topic after the initial posting. 
-            elif m["id"] in messages:
-                del messages[m["id"]]
-    
-    # Write data to file
-    field_names = ["id", "sender_id", "sender_name", "sender_email", "label", "content", "timestamp", "on_time", "valid"]
-    with open(filepath, "w", newline="") as csvfile:
-        writer = DictWriter(csvfile, field_names)
-        writer.writeheader()
-        writer.writerows(messages.values())
-    
+                    # Append new messages to the backup file; flag changed ones
+                    # (eg, a moderator reacted since the last run) for rewrite
+                    if m["id"] in existing_ids:
+                        if messages[m["id"]] != msg:
+                            rewrite = True
+                    else:
+                        writer.writerow(msg)
+                        existing_ids.add(m["id"])
+
+                    # Add message to message list
+                    messages[m["id"]] = msg
+
+                # If message is now not-to-be-kept but was in the backup file, it
+                # should be deleted. Since message sender cannot change, this can
+                # only happen if and only if a message is moved from a RQ topic to
+                # a non-RQ topic after the initial posting.
+                elif m["id"] in messages:
+                    del messages[m["id"]]
+                    rewrite = True
+
+    # Shut down the prefetcher and close the append handle, whether the
+    # scan finished or a page request raised partway through
+    finally:
+        executor.shutdown()
+        csvfile.close()
+
+    # A rebuild covered the full stream history, so any cached message the
+    # scan did not return was deleted on the server and should be dropped
+    if rebuild:
+        stale = [x for x in messages if x not in fetched_ids]
+        for x in stale:
+            del messages[x]
+        if len(stale) > 0:
+            rewrite = True
+
+    # Rewrite the file from scratch only if cached rows changed or dropped
+    if rewrite:
+        with open(filepath, "w", newline="") as csvfile:
+            writer = DictWriter(csvfile, field_names)
+            writer.writeheader()
+            writer.writerows(messages.values())
+
     # Return
     return messages.values()
     
@@ -376,25 +574,21 @@ def do_tally(messages: list) -> dict:
     - tally[x]["no_credit"] is a list of the assignment labels for which the
       user with user id x had only late or invalid posts. 
     """
-    # Initial tally of all messages
-    initial = {}
+    # Initial tally of all messages: one pass, OR-ing in whether each
+    # (sender, label) pair has at least one on-time and valid post
+    initial = defaultdict(lambda: defaultdict(bool))
     for m in messages:
-        x = m["sender_id"]
-        a = m["label"]
-        if x not in initial.keys():
-            initial[x] = {}
-        if a not in initial[x].keys():
-            initial[x][a] = False
-        initial[x][a] = initial[x][a] or (m["on_time"] and m["valid"])
-    
-    # Consolidate tallies as lists
-    tally = {}    
-    for x in initial.keys():
-        tally[x] = {}
-        tally[x]["credit"] = [a for a, v in initial[x].items() if v]
-        tally[x]["no_credit"] = [a for a, v in initial[x].items() if not v]
-    
-    # Return    
+        initial[m["sender_id"]][m["label"]] |= m["on_time"] and m["valid"]
+
+    # Consolidate tallies as lists, one pass per sender
+    tally = {}
+    for x, by_label in initial.items():
+        credit, no_credit = [], []
+        for a, v in by_label.items():
+            (credit if v else no_credit).append(a)
+        tally[x] = {"credit": credit, "no_credit": no_credit}
+
+    # Return
     return tally
     
 def individual_count(tally: dict, interloc_id: int) -> str:
@@ -406,18 +600,16 @@ def individual_count(tally: dict, interloc_id: int) -> str:
     # Extract interlocutor's data from the tally
     interloc_tally = tally.get(interloc_id, {"credit": [], "no_credit": []})
     
-    # Generate verbose response
-    response = f"Current RQ Count: {len(interloc_tally['credit'])}"
-    
+    # Generate verbose response, joining the pieces in one pass
+    parts = [f"Current RQ Count: {len(interloc_tally['credit'])}"]
+
     if len(interloc_tally["credit"]) > 0:
-        response += f"\nOn-time and Valid RQs: "
-        response += ", ".join(interloc_tally["credit"])
+        parts.append("On-time and Valid RQs: " + ", ".join(interloc_tally["credit"]))
     if len(interloc_tally["no_credit"]) > 0:
-        response += f"\nLate or Invalid RQs: "
-        response += ", ".join(interloc_tally["no_credit"])
-    
+        parts.append("Late or Invalid RQs: " + ", ".join(interloc_tally["no_credit"]))
+
     # Return
-    return response
+    return "\n".join(parts)
     
 def all_counts(tally: dict, users: UserList) -> str:
     """
@@ -427,18 +619,19 @@ def all_counts(tally: dict, users: UserList) -> str:
     
     The first argument should be a dict as output by the tally method. 
     """
-    # CSV header
-    response = "name,email,count"
-    response += "\n"
-    
-    # CSV content
-    for x in tally.keys():
-        u = users.get(x)
-        name = u["full_name"]
-        email = u["delivery_email"]
-        count = len(tally[x]["credit"])
-        response += f"{name},{email},{count}\n"
-    
-    # Return  
-    return response
+    # Rows are generated as bare tuples and handed to writerows in one call,
+    # so the per-row Python work is just the three cell lookups; csv.writer
+    # still takes care of quoting names that happen to contain commas
+    def rows():
+        for x, t in tally.items():
+            u = users.get(x)
+            yield u["full_name"], u["delivery_email"], len(t["credit"])
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator = "\n")
+    writer.writerow(["name", "email", "count"])
+    writer.writerows(rows())
+
+    # Return
+    return buffer.getvalue()
     
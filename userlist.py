@@ -49,6 +49,19 @@ class UserList:
             with open(self.filepath, "w", newline="") as csvfile:
                 writer = DictWriter(csvfile, self.field_names)
                 writer.writeheader()
+
+        # Keep one append handle open for writing new users, rather than
+        # opening and closing the file on every cache miss. New rows are
+        # buffered in _pending and written out in batches by flush().
+        self._csvfile = open(self.filepath, "a", newline="")
+        self._writer = DictWriter(self._csvfile, self.field_names)
+        self._pending = []
+
+        # Computed lazily by moderator_ids()
+        self._mod_ids = None
+
+        # Filled by prefetch() on the first cache miss in get()
+        self._members = None
         
     def get(self, user_id):
         """
@@ -59,31 +72,85 @@ class UserList:
         """
         user_id = int(user_id)
         # Return from exisiting data if possible
-        if user_id in self.users.keys():
+        if user_id in self.users:
             return self.users[user_id]
-        # Otherwise, request from client and store
+
+        # On the first miss, fetch the whole organization in one request
+        # rather than requesting users one at a time
+        if self._members is None:
+            self.prefetch()
+
+        # Serve from the prefetched data if possible, persisting the user;
+        # otherwise fall back to a one-off request
+        if user_id in self._members:
+            return self._store(self._members[user_id])
         else:
             return self.get_from_client(user_id)
-        
+
+    def prefetch(self):
+        """
+        Fetch all users in the Zulip organization with a single get_members
+        request and keep them in memory, so that cache misses in get() are
+        served locally instead of with one get_user_by_id round trip each.
+        Only users actually requested through get() are added to the user
+        list and its backing file.
+        """
+        result = self.client.get_members({"include_custom_profile_fields": False})
+        self._members = { u["user_id"]: u for u in result["members"] }
+
     def get_from_client(self, user_id):
         """
         Request user information using the client. Add the result to the
-        existing list in memory, and return the data. 
+        existing list in memory, and return the data.
         """
-        # Request and filter
         user = self.client.get_user_by_id(user_id)["user"]
+        return self._store(user)
+
+    def _store(self, user):
+        """
+        For internal use only. Filter the given user data down to
+        field_names, persist it to the backing file, add it to the list in
+        memory, and return it.
+        """
+        # Filter
         user = { k: user[k] for k in self.field_names }
-        
-        # Write data to file
-        with open(self.filepath, "a", newline="") as csvfile:
-            writer = DictWriter(csvfile, self.field_names)
-            writer.writerow(user)
-        
-        # Append data to list and return
-        self.users[int(user_id)] = user
-        
+        user_id = int(user["user_id"])
+
+        # Buffer the row for the backing file, flushing a full buffer
+        self._pending.append(user)
+        if len(self._pending) >= 32:
+            self.flush()
+
+        # Append data to list
+        self.users[user_id] = user
+
+        # Keep the cached moderator set up to date
+        if self._mod_ids is not None and user["role"] <= 300:
+            self._mod_ids.add(user_id)
+
         # Return
         return user
+
+    def flush(self):
+        """
+        Write any buffered new users out to the backing file. This happens
+        automatically whenever the buffer fills up; whoever created the
+        UserList should also call it once a batch of lookups is done.
+        """
+        if len(self._pending) > 0:
+            self._writer.writerows(self._pending)
+            self._csvfile.flush()
+            self._pending = []
+
+    def moderator_ids(self):
+        """
+        Return the set of user ids of the users in this list whose role is
+        moderator or above (ie, role at most 300). The set is computed once
+        and kept up to date as new users are fetched from the client.
+        """
+        if self._mod_ids is None:
+            self._mod_ids = {x for x, u in self.users.items() if u["role"] <= 300}
+        return self._mod_ids
         
     def keys(self):
         """